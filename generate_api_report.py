@@ -4,10 +4,10 @@ Sprint Report Generator - Refined Version
 Generates sprint reports from Jira Issue Navigator URL and config.yaml
 """
 
-import yaml
 import argparse
 import sys
 import re
+from collections import Counter
 from typing import Dict, List
 from urllib.parse import urlparse, parse_qs, unquote
 from jira_client import JiraClient
@@ -16,11 +16,57 @@ import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Patterns used by generate_epic_summary()
+_ISTIO_VER_RE = re.compile(r'(\d+\.\d+(?:\.\d+)?)\s*-\s*(\d+\.\d+(?:\.\d+)?)')
+_PAREN_RE = re.compile(r'\(([^)]+)\)')
+_BRACKET_RE = re.compile(r'\[([^\]]+)\]')
+
+
+def extract_jql(url: str) -> str:
+    """Extract JQL query from Jira issue navigator URL"""
+    try:
+        parsed = urlparse(url)
+        params = parse_qs(parsed.query)
+
+        # Look for JQL in different possible parameter names
+        jql = None
+        if 'jql' in params:
+            jql = params['jql'][0]
+        elif 'jqlQuery' in params:
+            jql = params['jqlQuery'][0]
+
+        if jql:
+            # Decode URL encoding
+            jql = unquote(jql)
+            logger.info(f"📋 Extracted JQL from URL")
+            return jql
+        else:
+            logger.error("❌ No JQL found in URL")
+            logger.info("URL should contain: ?jql=...")
+            sys.exit(1)
+
+    except Exception as e:
+        logger.error(f"❌ Error parsing URL: {e}")
+        sys.exit(1)
+
+
+def load_yaml(path: str) -> Dict:
+    """Load a YAML file, using the libyaml C loader when available"""
+    # Imported here so `--help` doesn't pay for yaml
+    import yaml
+    try:
+        from yaml import CSafeLoader as SafeLoader
+    except ImportError:
+        from yaml import SafeLoader
+
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=SafeLoader)
+
 
 class SprintReportGenerator:
     """Generate sprint reports from Jira Issue Navigator URL"""
     
-    def __init__(self, config_path: str = 'config.yaml'):
+    def __init__(self, config_path: str = 'config.yaml', use_cache: bool = False):
         """Initialize generator with config file"""
         self.config_path = config_path
         self.config = self._load_config()
@@ -28,13 +74,12 @@ class SprintReportGenerator:
         
         # Initialize Jira client
         jira_config = self.config.get('jira', {})
-        self.client = JiraClient(server_url=jira_config.get('server_url'))
+        self.client = JiraClient(server_url=jira_config.get('server_url'), use_cache=use_cache)
     
     def _load_config(self) -> Dict:
         """Load YAML configuration file"""
         try:
-            with open(self.config_path, 'r') as f:
-                config = yaml.safe_load(f)
+            config = load_yaml(self.config_path)
             logger.info(f"✅ Loaded configuration from {self.config_path}")
             return config
         except FileNotFoundError:
@@ -72,117 +117,48 @@ class SprintReportGenerator:
         
         logger.info("✅ Configuration validated successfully")
     
-    def _extract_jql_from_url(self, url: str) -> str:
-        """Extract JQL query from Jira issue navigator URL"""
-        try:
-            parsed = urlparse(url)
-            params = parse_qs(parsed.query)
-            
-            # Look for JQL in different possible parameter names
-            jql = None
-            if 'jql' in params:
-                jql = params['jql'][0]
-            elif 'jqlQuery' in params:
-                jql = params['jqlQuery'][0]
-            
-            if jql:
-                # Decode URL encoding
-                jql = unquote(jql)
-                logger.info(f"📋 Extracted JQL from URL")
-                return jql
-            else:
-                logger.error("❌ No JQL found in URL")
-                logger.info("URL should contain: ?jql=...")
-                sys.exit(1)
-                
-        except Exception as e:
-            logger.error(f"❌ Error parsing URL: {e}")
-            sys.exit(1)
-    
-    def fetch_sprint_data(self) -> Dict:
-        """Fetch sprint issues from Jira using the issue navigator URL"""
-        jira_config = self.config.get('jira', {})
-        issue_navigator_url = jira_config.get('issue_navigator_url')
-        
-        # Extract JQL from URL
-        jql = self._extract_jql_from_url(issue_navigator_url)
+    def fetch_sprint_data(self, jql: str = None) -> Dict:
+        """Fetch sprint issues from Jira using the issue navigator URL (or an explicit JQL)"""
+        if jql is None:
+            issue_navigator_url = self.config.get('jira', {}).get('issue_navigator_url')
+            jql = extract_jql(issue_navigator_url)
         
         logger.info(f"🔍 Fetching issues from Jira...")
         raw_issues = self.client.search_issues(jql, max_results=500)
 
-        # Parse issues
-        parsed_issues = [self.client.parse_issue(issue) for issue in raw_issues]
-        
-        valid_issue_keys = set(issue['key'] for issue in parsed_issues)
-        logger.info(f"✅ Found {len(valid_issue_keys)} issues from JQL")
-
-        # FIX #1: Use epic_link instead of parent_key
-        # Collect epic keys that are either:
-        # 1. Present in the original JQL results (epics themselves)
-        # 2. Referenced by epic_link in children
-        epics_in_jql = set()
-        epic_links_from_children = set()
-        
-        for issue in parsed_issues:
-            issue_type = issue.get('issuetype', '')
-            
-            # If this issue IS an epic, include it
-            if issue_type == 'Epic':
-                epics_in_jql.add(issue['key'])
-            
-            # If this issue has an epic link, track it
-            epic_link = issue.get('epic_link')
-            if epic_link:
-                epic_links_from_children.add(epic_link)
+        # Parse and group by epic (using epic_link) in one pass
+        grouped_data = self.client.parse_and_group(raw_issues)
+        logger.info(f"✅ Fetched {len(raw_issues)} issue records from JQL")
+
+        # Epics present in the JQL results, and epic keys referenced via epic_link
+        # (collected by parse_and_group)
+        epic_details = grouped_data.pop('epic_issues')
+        epic_links_from_children = grouped_data.pop('epic_links')
 
         # FIX #2 & #3: Only fetch epic details for epics that are REFERENCED by children
         # We don't fetch epics that aren't in the JQL results unless they have children in the sprint
-        epic_keys_to_fetch = epic_links_from_children - epics_in_jql
-        
-        logger.info(f"📊 Epics in JQL: {len(epics_in_jql)}, Epic links from children: {len(epic_links_from_children)}")
+        epic_keys_to_fetch = epic_links_from_children - epic_details.keys()
         
-        epic_details = {}
-        
-        # Add epic details for epics that were in the original JQL
-        for issue in parsed_issues:
-            if issue.get('issuetype') == 'Epic':
-                epic_details[issue['key']] = issue
+        logger.info(f"📊 Epics in JQL: {len(epic_details)}, Epic links from children: {len(epic_links_from_children)}")
         
         # Fetch details for epic links that weren't in the original JQL
-        if epic_keys_to_fetch:
+        if not epic_keys_to_fetch:
+            logger.info("✅ All referenced epics are in the JQL results, skipping epic fetch")
+        else:
             logger.info(f"🔍 Fetching {len(epic_keys_to_fetch)} additional epic details...")
-            epic_jql = f"key in ({','.join(epic_keys_to_fetch)})"
+            # Sorted so the same epics always produce the same JQL (and cache entry)
+            epic_jql = f"key in ({','.join(sorted(epic_keys_to_fetch))})"
             epic_raws = self.client.search_issues(epic_jql, max_results=len(epic_keys_to_fetch))
             for epic in epic_raws:
                 epic_data = self.client.parse_issue(epic)
                 epic_details[epic_data['key']] = epic_data
             logger.info(f"✅ Fetched details for {len(epic_keys_to_fetch)} additional epics")
 
-        # Group by epic (using epic_link)
-        grouped_data = self.client.group_issues_by_parent(parsed_issues)
-        
-        # FIX #3: Only keep epics that have children from the original JQL
-        # or were themselves in the original JQL
-        filtered_epics = {}
-        for epic_key, epic_data in grouped_data['epics'].items():
-            children = epic_data.get('children', [])
-            
-            # Keep epic if:
-            # 1. It was in the original JQL, OR
-            # 2. It has at least one child from the original JQL
-            if epic_key in epics_in_jql or any(child['key'] in valid_issue_keys for child in children):
-                # Filter children to only include those from original JQL
-                filtered_children = [child for child in children if child['key'] in valid_issue_keys]
-                epic_data['children'] = filtered_children
-                
-                if filtered_children or epic_key in epics_in_jql:
-                    filtered_epics[epic_key] = epic_data
-                    logger.info(f"  ✓ Including epic {epic_key} with {len(filtered_children)} children")
-        
-        grouped_data['epics'] = filtered_epics
-        
-        # Also filter standalone to only include issues from original JQL
-        grouped_data['standalone'] = [issue for issue in grouped_data['standalone'] if issue['key'] in valid_issue_keys]
+        # FIX #3: Epics and standalone issues are grouped only from the original JQL
+        # results, so every epic either was in the JQL or has at least one child from it
+        filtered_epics = grouped_data['epics']
+        for epic_key, epic_data in filtered_epics.items():
+            logger.info(f"  ✓ Including epic {epic_key} with {len(epic_data['children'])} children")
         
         # Attach epic details
         grouped_data['epic_details'] = epic_details
@@ -196,7 +172,7 @@ class SprintReportGenerator:
         if not children:
             return 'Unknown'
         
-        done_count = sum(1 for child in children if child.get('status_category', '').lower() == 'done')
+        done_count = sum(1 for child in children if child.get('status_category_lc', '') == 'done')
         
         if done_count == len(children):
             return 'Done'
@@ -207,29 +183,29 @@ class SprintReportGenerator:
         """Generate a smart summary of work done under the epic"""
         children = epic_data.get('children', [])
         total = len(children)
-        epic_name = epic_data.get('epic_name', '').lower()
+        epic_name_lc = epic_data.get('epic_name', '').lower()
         
-        done_children = [c for c in children if c.get('status_category', '').lower() == 'done']
+        done_children = [c for c in children if c.get('status_category_lc', '') == 'done']
         done_count = len(done_children)
         
         # Check if this is an Istio rollout epic
-        if 'istio' in epic_name and 'rollout' in epic_name:
-            version_match = re.search(r'(\d+\.\d+(?:\.\d+)?)\s*-\s*(\d+\.\d+(?:\.\d+)?)', epic_name)
+        if 'istio' in epic_name_lc and 'rollout' in epic_name_lc:
+            version_match = _ISTIO_VER_RE.search(epic_name_lc)
             version_str = f"{version_match.group(1)} to {version_match.group(2)}" if version_match else "upgrade"
             
-            service_env_counts = {}
+            service_env_counts = Counter()
             for child in done_children:
                 summary = child.get('summary', '')
-                match = re.search(r'\(([^)]+)\)', summary)
+                match = _PAREN_RE.search(summary)
                 if match:
                     service_env = match.group(1).strip()
                     parts = service_env.rsplit(' ', 1)
                     if len(parts) == 2:
                         service, env = parts
                         key = f"{service} {env}"
-                        service_env_counts[key] = service_env_counts.get(key, 0) + 1
+                        service_env_counts[key] += 1
                     else:
-                        service_env_counts[service_env] = service_env_counts.get(service_env, 0) + 1
+                        service_env_counts[service_env] += 1
             
             summary_parts = []
             for service_env, count in sorted(service_env_counts.items()):
@@ -243,14 +219,14 @@ class SprintReportGenerator:
                 summary = f"Completed Istio {version_str} rollout across {done_count} clusters."
         
         # Check if this is an ArgoCD migration epic
-        elif 'argocd' in epic_name:
-            component = epic_name.split('-')[-1].strip() if '-' in epic_name else "component"
+        elif 'argocd' in epic_name_lc:
+            component = epic_name_lc.split('-')[-1].strip() if '-' in epic_name_lc else "component"
             component = component.title()
             
             env_list = []
             for child in done_children:
                 summary_text = child.get('summary', '')
-                env_match = re.search(r'\[([^\]]+)\]', summary_text)
+                env_match = _BRACKET_RE.search(summary_text)
                 if env_match:
                     env_list.append(env_match.group(1))
             
@@ -274,11 +250,11 @@ class SprintReportGenerator:
         
         return summary
     
-    def generate_markdown_report(self, output_path: str = None) -> str:
+    def generate_markdown_report(self, output_path: str = None, jql: str = None) -> str:
         """Generate markdown sprint report"""
         logger.info("📝 Generating sprint report...")
 
-        grouped_data = self.fetch_sprint_data()
+        grouped_data = self.fetch_sprint_data(jql=jql)
         epics_dict = grouped_data['epics']
         standalone = grouped_data['standalone']
         epic_details = grouped_data.get('epic_details', {})
@@ -304,25 +280,32 @@ class SprintReportGenerator:
                 'description': epic_name,
                 'targeted_sprint': targeted_sprint,
                 'status': epic_status,
+                'status_lc': epic_info.get('status_lc') or epic_status.lower(),
                 'details': summary
             })
 
         # Add standalone issues
         for issue in standalone:
             status = issue.get('status') or issue.get('status_category', '')
+            status_lc = issue.get('status_lc') or issue.get('status_category_lc', '')
             epic_entries.append({
                 'epic_key': issue['key'],
                 'description': issue['summary'],
                 'targeted_sprint': '',
                 'status': status,
+                'status_lc': status_lc,
                 'details': issue['summary'][:200]
             })
 
+        sprint_number, team_name, start_date, end_date = (
+            sprint_info.get(k, '') for k in ('sprint_number', 'team_name', 'start_date', 'end_date')
+        )
+
         # Build markdown report
         md_lines = [
-            f"# CCP K8s IST Sprint {sprint_info.get('sprint_number', '')} Report",
+            f"# CCP K8s IST Sprint {sprint_number} Report",
             "",
-            f"This sprint report highlights the achievements and overall progress of the {sprint_info.get('team_name', '')} team during CCP Sprint {sprint_info.get('sprint_number', '')} (from {sprint_info.get('start_date', '')} to {sprint_info.get('end_date', '')}). Below are the key updates and appreciations.",
+            f"This sprint report highlights the achievements and overall progress of the {team_name} team during CCP Sprint {sprint_number} (from {start_date} to {end_date}). Below are the key updates and appreciations.",
             "",
             "## A] Kudos/Appreciation",
             ""
@@ -331,17 +314,18 @@ class SprintReportGenerator:
         for kudo in self.config.get('kudos', []):
             md_lines.append(f"- {kudo}")
 
-        # Sort epic_entries: Done first, then In Progress, then others
-        def get_sort_order(entry):
-            status = entry['status'].lower()
+        # Order epic_entries: Done first, then In Progress, then others
+        done, in_progress, other = [], [], []
+        for entry in epic_entries:
+            status = entry['status_lc']
             if status == 'done':
-                return 0
+                done.append(entry)
             elif status == 'in progress':
-                return 1
+                in_progress.append(entry)
             else:
-                return 2
+                other.append(entry)
         
-        epic_entries_sorted = sorted(epic_entries, key=get_sort_order)
+        epic_entries_sorted = done + in_progress + other
 
         md_lines.extend([
             "",
@@ -351,11 +335,11 @@ class SprintReportGenerator:
             "|------|-------------|----------------|--------|---------|"
         ])
 
-        for epic in epic_entries_sorted:
-            epic_link = f"[{epic['epic_key']}](https://hpe.atlassian.net/browse/{epic['epic_key']})"
-            md_lines.append(
-                f"| {epic_link} | {epic['description']} | {epic['targeted_sprint']} | {epic['status']} | {epic['details']} |"
-            )
+        if epic_entries_sorted:
+            md_lines.append("\n".join(
+                f"| [{epic['epic_key']}](https://hpe.atlassian.net/browse/{epic['epic_key']}) | {epic['description']} | {epic['targeted_sprint']} | {epic['status']} | {epic['details']} |"
+                for epic in epic_entries_sorted
+            ))
 
         md_lines.extend([
             "",
@@ -401,6 +385,11 @@ def main():
         default=None,
         help='Override output file path from config (optional)'
     )
+    parser.add_argument(
+        '--use-cache',
+        action='store_true',
+        help="Reuse Jira search results cached earlier today instead of fetching fresh data"
+    )
     
     args = parser.parse_args()
     
@@ -410,7 +399,7 @@ def main():
     print()
     
     # Generate report
-    generator = SprintReportGenerator(config_path=args.config)
+    generator = SprintReportGenerator(config_path=args.config, use_cache=args.use_cache)
     
     # Test connection first
     logger.info("🔗 Testing Jira connection...")
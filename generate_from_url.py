@@ -6,53 +6,13 @@ Extracts JQL from the URL and generates the report
 
 import argparse
 import sys
-from urllib.parse import urlparse, parse_qs, unquote
-from generate_api_report import APIReportGenerator
+from generate_api_report import SprintReportGenerator, extract_jql, load_yaml
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-def extract_jql_from_url(url: str) -> str:
-    """
-    Extract JQL query from Jira issue navigator URL
-    
-    Args:
-        url: Full Jira issue navigator URL
-        
-    Returns:
-        JQL query string
-    """
-    try:
-        # Parse the URL
-        parsed = urlparse(url)
-        
-        # Get query parameters
-        params = parse_qs(parsed.query)
-        
-        # Look for JQL in different possible parameter names
-        jql = None
-        if 'jql' in params:
-            jql = params['jql'][0]
-        elif 'jqlQuery' in params:
-            jql = params['jqlQuery'][0]
-        
-        if jql:
-            # Decode URL encoding
-            jql = unquote(jql)
-            logger.info(f"Extracted JQL: {jql}")
-            return jql
-        else:
-            logger.error("No JQL found in URL. Make sure you're using the issue navigator URL.")
-            logger.info("URL should look like: https://hpe.atlassian.net/issues/?jql=...")
-            sys.exit(1)
-            
-    except Exception as e:
-        logger.error(f"Error parsing URL: {e}")
-        sys.exit(1)
-
-
 def main():
     """Main entry point"""
     parser = argparse.ArgumentParser(
@@ -81,13 +41,16 @@ Examples:
         required=False,
         help='Output markdown file path (default: sprint_report.md or config)'
     )
+    parser.add_argument(
+        '--use-cache',
+        action='store_true',
+        help="Reuse Jira search results cached earlier today instead of fetching fresh data"
+    )
 
     args = parser.parse_args()
 
     # Load config to get defaults if needed
-    import yaml
-    with open(args.config, 'r') as f:
-        config = yaml.safe_load(f)
+    config = load_yaml(args.config)
 
     # Determine URL: CLI arg > config > error
     url = args.url or config.get('jira_url')
@@ -102,21 +65,19 @@ Examples:
     print("=" * 80)
     print("EXTRACTING JQL FROM ISSUE NAVIGATOR URL")
     print("=" * 80)
-    jql = extract_jql_from_url(url)
+    jql = extract_jql(url)
     print(f"\n✅ JQL Query: {jql}\n")
 
     # Generate report
-    generator = APIReportGenerator(config_path=args.config)
-
-    # Override the JQL query from config with the one from URL
-    generator.config['jira']['jql_query'] = jql
+    generator = SprintReportGenerator(config_path=args.config, use_cache=args.use_cache)
 
     # Test connection first
     if not generator.client.test_connection():
         logger.error("Failed to connect to Jira. Please check your credentials.")
         sys.exit(1)
 
-    report = generator.generate_markdown_report(output_path=output_file)
+    # Use the JQL from the URL instead of the configured issue_navigator_url
+    report = generator.generate_markdown_report(output_path=output_file, jql=jql)
 
     print("\n" + "=" * 80)
     print("✅ REPORT GENERATED SUCCESSFULLY")
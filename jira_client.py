@@ -6,25 +6,62 @@ Handles authentication and data fetching from Jira REST API
 
 import os
 import sys
-import requests
+import json
+import hashlib
+import tempfile
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
 import logging
+from collections import defaultdict
 from pathlib import Path
-from dotenv import load_dotenv
 
-# Load .env file from the script's directory
+# orjson is optional; it parses large search responses several times faster than json
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# .env file in the script's directory, loaded when a client is created
 env_path = Path(__file__).parent / '.env'
-load_dotenv(dotenv_path=env_path)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Only the fields parse_issue() actually reads - requesting "*all" bloats every page
+DEFAULT_FIELDS = (
+    "summary,status,issuetype,parent,customfield_10011,customfield_10014,"
+    "customfield_10020"
+)
+
+# Fields needed by parse_issue(full=True)
+FULL_FIELDS = DEFAULT_FIELDS + ",description,assignee,created,updated"
+
+# Concurrent page requests issued by search_issues()
+MAX_WORKERS = 8
+
+# Search results are cached here, one file per JQL query per day
+CACHE_DIR = Path(__file__).parent / '.cache'
+
+# Largest page size we ask Jira for; the server may still return fewer per page
+MAX_PAGE_SIZE = 1000
+
 
 class JiraClient:
     """Client for interacting with Jira REST API"""
 
-    def __init__(self, server_url: str, email: str = None, api_token: str = None):
+    def __init__(self, server_url: str, email: str = None, api_token: str = None, use_cache: bool = False):
+        # Imported here rather than at module load so `--help` and config errors stay fast
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        from dotenv import load_dotenv
+
+        load_dotenv(dotenv_path=env_path)
+
         self.server_url = server_url.rstrip('/')
+        self.use_cache = use_cache
         self.email = email or os.getenv('JIRA_EMAIL')
         self.api_token = api_token or os.getenv('JIRA_API_TOKEN')
 
@@ -32,8 +69,23 @@ class JiraClient:
             logger.error("Jira credentials not found. Set JIRA_EMAIL and JIRA_API_TOKEN environment variables.")
             sys.exit(1)
 
+        # Kept for the methods that catch or raise request errors
+        self._req_exc = requests.exceptions
+
         self.session = requests.Session()
         self.session.auth = (self.email, self.api_token)
+        # Retry transient Jira errors (rate limiting, 5xx) with backoff, and keep the
+        # pool large enough for the concurrent page fetches to reuse connections
+        retry = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET'],
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=16, pool_maxsize=16)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.session.headers.update({
             'Accept': 'application/json',
             'Content-Type': 'application/json'
@@ -48,49 +100,160 @@ class JiraClient:
             user_info = response.json()
             logger.info(f"✅ Connected to Jira as: {user_info.get('displayName')}")
             return True
-        except requests.exceptions.RequestException as e:
+        except self._req_exc.RequestException as e:
             logger.error(f"❌ Failed to connect to Jira: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 logger.error(f"Response: {e.response.status_code}")
                 logger.error(f"Body: {e.response.text}")
             return False
 
-    def search_issues(self, jql: str, max_results: int = 2000) -> List[Dict]:
+    def _fetch_page(self, url: str, jql: str, start_at: int, page_size: int, fields: str,
+                    next_page_token: Optional[str] = None) -> Dict:
+        """Fetch a single page of JQL search results"""
+        params = {
+            "jql": jql,
+            "maxResults": page_size,
+            "fields": fields
+        }
+        # The enhanced search endpoint pages by token; startAt is only for offset paging
+        if next_page_token:
+            params["nextPageToken"] = next_page_token
+        else:
+            params["startAt"] = start_at
+
+        response = self.session.get(url, params=params)
+        response.raise_for_status()
+        try:
+            return _loads(response.content)
+        except ValueError as e:
+            # e.g. an HTML login page - surface it like response.json() would have
+            raise self._req_exc.InvalidJSONError(f"Invalid JSON in search response: {e}", response=response)
+
+    def _cache_path(self, jql: str, fields: str) -> Path:
+        """Cache file for a JQL query, keyed by server, query, fields and today's date"""
+        cache_key = f"{self.server_url}|{jql}|{fields}|{date.today().isoformat()}"
+        return CACHE_DIR / f"{hashlib.sha256(cache_key.encode()).hexdigest()}.json"
+
+    def _read_cache(self, cache_path: Path) -> Optional[List[Dict]]:
+        """Load cached search results, or None on a miss or a damaged cache entry"""
+        if not cache_path.exists():
+            return None
+        try:
+            with open(cache_path, 'rb') as f:
+                issues = _loads(f.read())
+            if not isinstance(issues, list):
+                raise ValueError(f"expected a list of issues, got {type(issues).__name__}")
+            return issues
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache {cache_path}: {e}")
+            try:
+                cache_path.unlink()
+            except OSError:
+                pass
+            return None
+
+    def _purge_stale_cache(self):
+        """Delete cache files written before today - their keys can never match again"""
+        today = date.today()
+        for path in CACHE_DIR.glob('*'):
+            try:
+                if path.suffix in ('.json', '.tmp') and date.fromtimestamp(path.stat().st_mtime) < today:
+                    path.unlink()
+            except OSError as e:
+                logger.warning(f"Failed to remove stale cache {path}: {e}")
+
+    def _write_cache(self, cache_path: Path, issues: List[Dict]):
+        """Atomically write search results to the cache"""
+        tmp_path = None
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self._purge_stale_cache()
+            fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(issues, f)
+            os.replace(tmp_path, cache_path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to write cache {cache_path}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def search_issues(self, jql: str, max_results: int = 2000, fields: str = DEFAULT_FIELDS,
+                      page_size: int = 500) -> List[Dict]:
         """Search for issues using Jira JQL (new API endpoint)"""
+        cache_path = self._cache_path(jql, fields)
+        if self.use_cache:
+            all_issues = self._read_cache(cache_path)
+            if all_issues is not None:
+                # Cached data can be hours old - make that visible, not just an INFO line
+                logger.warning(
+                    f"⚠️ Using {len(all_issues)} cached issues from {date.today().isoformat()} "
+                    f"({cache_path}) - changes in Jira since then are not included"
+                )
+                return all_issues
+
         try:
             url = f"{self.server_url}/rest/api/3/search/jql"
-
-            all_issues = []
-            start_at = 0
-
-            while True:
-                # New API format - need to request fields explicitly
-                params = {
-                    "jql": jql,
-                    "startAt": start_at,
-                    "maxResults": min(max_results, 100),
-                    "fields": "*all"  # Request all fields
-                }
-
-                response = self.session.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
-
-                issues = data.get("issues", [])
-                all_issues.extend(issues)
-
-                logger.info(f"Fetched {len(issues)} issues (total: {len(all_issues)})")
-
-                total = data.get("total", 0)
-                if start_at + len(issues) >= total or len(issues) == 0:
-                    break
-
-                start_at += len(issues)
+            page_size = min(max_results, page_size, MAX_PAGE_SIZE)
+
+            data = self._fetch_page(url, jql, 0, page_size, fields)
+            all_issues = data.get("issues", [])
+            total = data.get("total")
+
+            if total is None:
+                # Enhanced search (/search/jql) reports no total - follow nextPageToken
+                # one request at a time until Jira marks the last page
+                logger.info(f"Fetched {len(all_issues)} issues")
+                while data.get("nextPageToken") and not data.get("isLast", False):
+                    data = self._fetch_page(url, jql, 0, page_size, fields,
+                                            next_page_token=data["nextPageToken"])
+                    issues = data.get("issues", [])
+                    all_issues.extend(issues)
+                    logger.info(f"Fetched {len(issues)} issues (total: {len(all_issues)})")
+
+                complete = data.get("isLast", not data.get("nextPageToken"))
+                if not complete:
+                    logger.warning(
+                        f"⚠️ Jira did not mark the last page after {len(all_issues)} issues - "
+                        f"results may be incomplete"
+                    )
+            else:
+                # Offset paging: the first page tells us the total, the rest are fetched concurrently
+                logger.info(f"Fetched {len(all_issues)} issues (total: {total})")
+
+                # Server capped the page below what we asked for - page by what it actually returns
+                if 0 < len(all_issues) < page_size and len(all_issues) < total:
+                    logger.info(f"Server limited page size to {len(all_issues)} (requested {page_size})")
+                    page_size = len(all_issues)
+
+                offsets = range(page_size, total, page_size) if all_issues else range(0)
+                if offsets:
+                    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                        futures = [
+                            executor.submit(self._fetch_page, url, jql, start_at, page_size, fields)
+                            for start_at in offsets
+                        ]
+                        # Collect in submission order so issues keep the JQL ordering
+                        for future in futures:
+                            issues = future.result().get("issues", [])
+                            all_issues.extend(issues)
+                            logger.info(f"Fetched {len(issues)} issues (total: {len(all_issues)})")
+
+                # Pages are requested at fixed offsets, so a short page or a total that changed
+                # mid-fetch shows up here rather than being picked up by the next request
+                complete = len(all_issues) == total
+                if not complete:
+                    logger.warning(
+                        f"⚠️ Fetched {len(all_issues)} issues but Jira reported {total} - "
+                        f"results may be incomplete"
+                    )
 
             logger.info(f"Total issues fetched: {len(all_issues)}")
+            # Never cache a possibly truncated result
+            if self.use_cache and complete:
+                self._write_cache(cache_path, all_issues)
             return all_issues
 
-        except requests.exceptions.RequestException as e:
+        except self._req_exc.RequestException as e:
             logger.error(f"Failed JQL search: {e}")
             if hasattr(e, "response") and e.response is not None:
                 logger.error(f"Response status: {e.response.status_code}")
@@ -103,8 +266,13 @@ class JiraClient:
         logger.info(f"Running JQL: {jql}")
         return self.search_issues(jql)
 
-    def parse_issue(self, issue: Dict) -> Dict:
-        """Normalize Jira fields for consistent handling"""
+    def parse_issue(self, issue: Dict, full: bool = False) -> Dict:
+        """Normalize Jira fields for consistent handling
+
+        Only the fields the report uses are returned unless full=True, which also
+        includes description, parent, assignee and timestamp fields (search with
+        fields=FULL_FIELDS to have them populated).
+        """
         fields = issue.get("fields", {})
 
         # Epic Link - in new API, parent field is populated for epic relationship
@@ -115,7 +283,7 @@ class JiraClient:
         
         # Fallback to customfield_10014 if parent is not an epic
         if not epic_link:
-            epic_link = fields.get("customfield_10014", "")
+            epic_link = fields.get("customfield_10014", "") or ""
         
         # Epic Name (only for issues that ARE epics)
         epic_name = fields.get("customfield_10011", "")
@@ -126,56 +294,70 @@ class JiraClient:
         if sprint_field and isinstance(sprint_field, list) and len(sprint_field) > 0:
             sprint_name = sprint_field[0].get("name", "")
 
-        return {
-            "key": issue.get("key", ""),
+        status = fields.get("status", {}).get("name", "")
+        status_category = fields.get("status", {}).get("statusCategory", {}).get("name", "")
+
+        parsed = {
+            # Interned so the many set/dict lookups on keys hit the identity fast path
+            "key": sys.intern(issue.get("key", "")),
             "summary": fields.get("summary", ""),
-            "description": fields.get("description", ""),
-            "status": fields.get("status", {}).get("name", ""),
-            "status_category": fields.get("status", {}).get("statusCategory", {}).get("name", ""),
+            "status": status,
+            "status_category": status_category,
+            # Lowercased once here so report code doesn't repeat it per comparison
+            "status_lc": status.lower(),
+            "status_category_lc": status_category.lower(),
             "issuetype": fields.get("issuetype", {}).get("name", ""),
 
             # Epic relationship
-            "epic_link": epic_link,
+            "epic_link": sys.intern(epic_link),
             "epic_name": epic_name,
 
-            # Parent info (for reference)
-            "parent_key": parent.get("key", "") if parent else "",
-            "parent_summary": parent.get("fields", {}).get("summary", "") if parent else "",
-
-            "assignee": fields.get("assignee", {}).get("displayName", "") if fields.get("assignee") else "",
-            "created": fields.get("created", ""),
-            "updated": fields.get("updated", ""),
             "sprint": sprint_name
         }
 
-    def group_issues_by_parent(self, issues: List[Dict]) -> Dict:
-        """Group issues under their epics correctly"""
-        epics = {}
-        standalone = []
+        if full:
+            parsed.update({
+                "description": fields.get("description", ""),
 
-        for issue in issues:
-            issue_type = issue.get("issuetype", "")
+                # Parent info (for reference)
+                "parent_key": parent.get("key", "") if parent else "",
+                "parent_summary": parent.get("fields", {}).get("summary", "") if parent else "",
 
-            # If the issue is an Epic, register it
-            if issue_type == "Epic":
-                epics[issue["key"]] = {
-                    "epic_key": issue["key"],
-                    "epic_name": issue["epic_name"] or issue["summary"],
-                    "children": []
-                }
-                continue
+                "assignee": fields.get("assignee", {}).get("displayName", "") if fields.get("assignee") else "",
+                "created": fields.get("created", ""),
+                "updated": fields.get("updated", "")
+            })
 
-            # If the issue belongs to an epic (Epic Link)
-            epic_key = issue.get("epic_link")
+        return parsed
+
+    def parse_and_group(self, raw_issues: List[Dict]) -> Dict:
+        """Parse raw Jira issues and group them under their epics in a single pass"""
+        epics = defaultdict(lambda: {"epic_key": "", "epic_name": "", "children": []})
+        standalone = []
+        epic_issues = {}
+        epic_links = set()
 
+        for raw_issue in raw_issues:
+            issue = self.parse_issue(raw_issue)
+            key = issue["key"]
+            epic_key = issue["epic_link"]
+
+            # Track every epic referenced through an Epic Link
             if epic_key:
-                if epic_key not in epics:
-                    epics[epic_key] = {
-                        "epic_key": epic_key,
-                        "epic_name": "",
-                        "children": []
-                    }
-                epics[epic_key]["children"].append(issue)
+                epic_links.add(epic_key)
+
+            # If the issue is an Epic, register it (keeping any children seen before it)
+            if issue["issuetype"] == "Epic":
+                epic_issues[key] = issue
+                epic = epics[key]
+                epic["epic_key"] = key
+                epic["epic_name"] = issue["epic_name"] or issue["summary"]
+
+            # If the issue belongs to an epic (Epic Link)
+            elif epic_key:
+                epic = epics[epic_key]
+                epic["epic_key"] = epic_key
+                epic["children"].append(issue)
 
             else:
                 standalone.append(issue)
@@ -183,6 +365,10 @@ class JiraClient:
         logger.info(f"Grouped {len(epics)} epics and {len(standalone)} standalone issues")
 
         return {
-            "epics": epics,
-            "standalone": standalone
+            "epics": dict(epics),
+            "standalone": standalone,
+            # Parsed Epic issues that were part of raw_issues, keyed by epic key
+            "epic_issues": epic_issues,
+            # Every epic key referenced by an issue's Epic Link
+            "epic_links": epic_links
         }